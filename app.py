@@ -3,17 +3,90 @@ Flask app for taxonomic lineage viewing
 Clean, minimal interface to view and compare taxonomic lineages
 """
 
+import hmac
+import json
+import os
+import orjson
 from flask import Flask, render_template, jsonify, request
+from flask.json.provider import JSONProvider
+from flask_caching import Cache
+from flask_compress import Compress
 from models import SimpleLineageViewer
 from setup import auto_initializer
 
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify for every API response"""
+    
+    def dumps(self, obj, **kwargs):
+        # Options such as indent or sort_keys have no orjson equivalent here; honour them via json
+        if kwargs:
+            return json.dumps(obj, **kwargs)
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # orjson already yields bytes; going through dumps() would decode and re-encode them
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype="application/json")
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Lineage payloads are repetitive JSON and shrink well; tiny responses are left alone
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 500
+Compress(app)
+
+# Read endpoints only change when an import lands; share the cache via Redis when available
+cache = Cache(app, config={
+    'CACHE_TYPE': 'RedisCache' if os.getenv('REDIS_URL') else 'SimpleCache',
+    'CACHE_REDIS_URL': os.getenv('REDIS_URL'),
+    'CACHE_DEFAULT_TIMEOUT': 3600
+})
+
+def is_cacheable(response):
+    """Only cache successful, non-empty responses; errors are returned as (body, status) tuples"""
+    if isinstance(response, tuple):
+        return False
+    # An empty list (e.g. no species while an ingest is reloading the database) must be
+    # retried rather than served for the whole cache timeout
+    payload = response.get_json(silent=True)
+    return not (isinstance(payload, dict) and any(value == [] for value in payload.values()))
+
+def project_fields(data, fields):
+    """Keep only the comma-separated dotted paths of a ?fields= selector, e.g. species1.display_name"""
+    projected = {}
+    for path in fields.split(','):
+        keys = path.strip().split('.')
+        value = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+    return projected
+
+# Shared secret required by /api/cache/clear; unset disables the route
+CACHE_ADMIN_TOKEN = os.getenv('CACHE_ADMIN_TOKEN')
+
+# Upper bound on pairs accepted by /api/compare/batch in one request
+MAX_BATCH_PAIRS = 100
 
 # Initialize the lineage viewer
 try:
     lineage_viewer = SimpleLineageViewer()
     print("🚀 Connected to Neo4j database")
     
+    # Cached lineages and responses go stale once a fresh import lands
+    auto_initializer.add_completion_callback(lineage_viewer.clear_cache)
+    auto_initializer.add_completion_callback(cache.clear)
+    
     # Check if database is empty and auto-start import if needed
     if lineage_viewer.is_database_empty():
         print("📦 Database is empty - starting automatic import...")
@@ -22,6 +95,8 @@ try:
         else:
             print("❌ Failed to start import")
     else:
+        # Search and lineage lookups assume these indexes; refuse to serve without them
+        lineage_viewer.ensure_indexes()
         print("✅ Database contains data - ready to serve")
         
 except Exception as e:
@@ -34,6 +109,7 @@ def index():
     return render_template('index.html')
 
 @app.route('/api/search')
+@cache.cached(query_string=True, response_filter=is_cacheable)
 def search_species():
     """Search for species by name"""
     if not lineage_viewer:
@@ -50,6 +126,7 @@ def search_species():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/lineage/<int:taxid>')
+@cache.cached(response_filter=is_cacheable)
 def get_lineage(taxid):
     """Get the lineage of a species"""
     if not lineage_viewer:
@@ -65,6 +142,7 @@ def get_lineage(taxid):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/sample')
+@cache.cached(response_filter=is_cacheable)
 def get_sample_species():
     """Get sample species for initial display"""
     if not lineage_viewer:
@@ -77,6 +155,7 @@ def get_sample_species():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/compare/<int:taxid>')
+@cache.cached(query_string=True, response_filter=is_cacheable)
 def compare_with_human(taxid):
     """Compare a species lineage with human lineage"""
     if not lineage_viewer:
@@ -84,15 +163,20 @@ def compare_with_human(taxid):
     
     try:
         # Always compare with human (taxid: 9606)
-        comparison = lineage_viewer.get_comparative_lineage(taxid, 9606)
+        comparison = lineage_viewer.compare_with_human(taxid)
         if 'error' in comparison:
             return jsonify(comparison), 404
         
+        fields = request.args.get('fields')
+        if fields:
+            comparison = project_fields(comparison, fields)
+        
         return jsonify(comparison)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/compare/<int:taxid1>/<int:taxid2>')
+@cache.cached(query_string=True, response_filter=is_cacheable)
 def compare_two_species(taxid1, taxid2):
     """Compare lineages of two species"""
     if not lineage_viewer:
@@ -103,10 +187,40 @@ def compare_two_species(taxid1, taxid2):
         if 'error' in comparison:
             return jsonify(comparison), 404
         
+        fields = request.args.get('fields')
+        if fields:
+            comparison = project_fields(comparison, fields)
+        
         return jsonify(comparison)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/compare/batch', methods=['POST'])
+def compare_batch():
+    """Compare many species pairs in one request"""
+    # Malformed requests are rejected before the database is even considered
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object with a "pairs" list'}), 400
+    
+    pairs = payload.get('pairs')
+    if not isinstance(pairs, list) or not pairs:
+        return jsonify({'error': 'Expected a non-empty "pairs" list'}), 400
+    if len(pairs) > MAX_BATCH_PAIRS:
+        return jsonify({'error': f'At most {MAX_BATCH_PAIRS} pairs per request'}), 400
+    if not all(isinstance(pair, list) and len(pair) == 2 and all(type(t) is int for t in pair)
+               for pair in pairs):
+        return jsonify({'error': 'Each pair must be [taxid1, taxid2]'}), 400
+    
+    if not lineage_viewer:
+        return jsonify({'error': 'Database not available'}), 500
+    
+    try:
+        comparisons = lineage_viewer.get_comparative_lineages([tuple(pair) for pair in pairs])
+        return jsonify({'comparisons': comparisons})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/import/status')
 def import_status():
     """Get import status"""
@@ -126,5 +240,21 @@ def import_status():
     
     return jsonify(status)
 
+@app.route('/api/cache/clear', methods=['POST'])
+def clear_cache():
+    """Drop cached lineages, comparisons and API responses"""
+    # Clearing sends every request back to Neo4j (and scans Redis), so it is admin-only;
+    # with no token configured the route is disabled and imports clear the caches themselves
+    token = request.headers.get('X-Admin-Token', '')
+    if not CACHE_ADMIN_TOKEN or not hmac.compare_digest(token, CACHE_ADMIN_TOKEN):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if lineage_viewer:
+        lineage_viewer.clear_cache()
+    cache.clear()
+    
+    return jsonify({'cleared': True})
+
 if __name__ == '__main__':
+    # Development server only; the Docker image serves through gunicorn's thread pool
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -4,239 +4,462 @@ Focus: Just view the lineage of a species by taxID
 """
 
 import os
-from neo4j import GraphDatabase
-from typing import List, Dict, Optional
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from neo4j import GraphDatabase, Result, RoutingControl
+from typing import List, Dict, Optional, Tuple
+
+# Bolt connections are pooled by the driver and shared by all request threads
+MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "64"))
+CONNECTION_ACQUISITION_TIMEOUT = 30
+# Connections opened at startup so the first requests don't pay for the handshake
+POOL_WARMUP_CONNECTIONS = 8
+
+# Schema the read queries rely on; also created by the importer in setup.py
+TAXID_CONSTRAINT_QUERY = """
+    CREATE CONSTRAINT taxon_taxid IF NOT EXISTS
+    FOR (t:Taxon) REQUIRE t.taxid IS UNIQUE
+"""
+NAMES_FULLTEXT_INDEX_QUERY = """
+    CREATE FULLTEXT INDEX taxon_names_fulltext IF NOT EXISTS
+    FOR (t:Taxon) ON EACH [t.scientific_name, t.common_name]
+"""
+
+# Characters with a meaning in Lucene query syntax
+LUCENE_SPECIAL_CHARS = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+# Lineages only change when the taxonomy is re-imported, so results are memoized per taxid
+LINEAGE_CACHE_SIZE = 4096
+
+# The import status page polls emptiness; an empty answer is rechecked at most this often
+EMPTY_CHECK_TTL = 5
+
+# /api/compare/<taxid> always compares against human; the importer stores each
+# species' ancestors shared with it so that comparison needs no lineage intersection
+HUMAN_TAXID = 9606
+
+# Some well-known taxids for common species, shown before the user searches
+SAMPLE_TAXIDS = (
+    9606,   # Human
+    9615,   # Dog
+    9685,   # Cat
+    9796,   # Horse
+    9913,   # Cow
+    9031,   # Chicken
+    8030,   # Salmon
+    7227,   # Fruit fly
+    4932,   # Yeast
+    562     # E. coli
+)
+
+
+class _Uncached(Exception):
+    """Carries a miss out of an lru_cache, which never stores raised results"""
+    
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
+
+def _cache_hits(func, maxsize: int = LINEAGE_CACHE_SIZE):
+    """lru_cache func, but leave empty and error results uncached so they are retried later"""
+    # A miss during an import (e.g. by the separate ingest service) must not stick until restart
+    @lru_cache(maxsize=maxsize)
+    def cached(*args):
+        result = func(*args)
+        if not result or (isinstance(result, dict) and 'error' in result):
+            raise _Uncached(result)
+        return result
+    
+    def lookup(*args):
+        try:
+            return cached(*args)
+        except _Uncached as miss:
+            return miss.result
+    
+    lookup.cache_clear = cached.cache_clear
+    lookup.cache_info = cached.cache_info
+    return lookup
 
 class SimpleLineageViewer:
-    def __init__(self, uri=None, user=None, password=None):
+    def __init__(self, uri=None, user=None, password=None, database=None):
         """Initialize connection to Neo4j database"""
         # Use environment variables with fallback to defaults
         uri = uri or os.getenv("NEO4J_URI", "bolt://localhost:7687")
         user = user or os.getenv("NEO4J_USERNAME", "neo4j")
         password = password or os.getenv("NEO4J_PASSWORD", "neotaxonomy")
+        # Naming the database up front saves the driver a home-database lookup per session
+        self.database = database or os.getenv("NEO4J_DATABASE", "neo4j")
         
         try:
-            self.driver = GraphDatabase.driver(uri, auth=(user, password))
-            # Test connection
-            with self.driver.session() as session:
-                session.run("RETURN 1")
+            self.driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_connection_pool_size=MAX_CONNECTION_POOL_SIZE,
+                connection_acquisition_timeout=CONNECTION_ACQUISITION_TIMEOUT,
+                keep_alive=True
+            )
+            # Test connection, then fill the pool concurrently
+            self.driver.verify_connectivity()
+            with ThreadPoolExecutor(max_workers=POOL_WARMUP_CONNECTIONS) as executor:
+                list(executor.map(lambda _: self._ping(), range(POOL_WARMUP_CONNECTIONS)))
             print(f"✅ Connected to Neo4j at {uri}")
         except Exception as e:
             print(f"❌ Failed to connect to Neo4j: {e}")
             raise
+        
+        self._lineage_cache = _cache_hits(self._query_species_lineage)
+        self._comparison_cache = _cache_hits(self._query_comparative_lineage)
+        self._human_comparison_cache = _cache_hits(self._query_human_comparison)
+        self._sample_cache = _cache_hits(self._query_sample_species, maxsize=1)
+        self._empty_checked_at = None
+        self._has_data = False
     
     def close(self):
         """Close the database connection"""
         self.driver.close()
     
+    def clear_cache(self):
+        """Drop memoized lineages, e.g. after the taxonomy has been re-imported"""
+        self._lineage_cache.cache_clear()
+        self._comparison_cache.cache_clear()
+        self._human_comparison_cache.cache_clear()
+        self._sample_cache.cache_clear()
+        self._empty_checked_at = None
+        self._has_data = False
+    
+    def _read(self, query: str, **params) -> List[Dict]:
+        """Run a read query via the driver's managed execute_query API and return the rows as dicts"""
+        return self.driver.execute_query(
+            query, params,
+            database_=self.database,
+            routing_=RoutingControl.READ,
+            result_transformer_=Result.data
+        )
+    
+    def _read_taxa(self, query: str, **params) -> List[Dict]:
+        """Run a read query returning taxid, scientific_name, common_name and rank columns as taxon dicts"""
+        rows = self.driver.execute_query(
+            query, params,
+            database_=self.database,
+            routing_=RoutingControl.READ,
+            # Plain tuples skip building a Record, then a dict, for every row
+            result_transformer_=lambda result: result.values('taxid', 'scientific_name', 'common_name', 'rank')
+        )
+        return [
+            {'taxid': t, 'scientific_name': sn, 'common_name': cn, 'rank': r, 'display_name': cn or sn}
+            for t, sn, cn, r in rows
+        ]
+    
+    def _ping(self):
+        """Round-trip a trivial query, leaving its connection in the pool"""
+        self._read("RETURN 1")
+    
+    def ensure_indexes(self):
+        """Create the taxid lookup and name full-text indexes if missing; raises if that fails"""
+        with self.driver.session(database=self.database) as session:
+            # Databases imported before the constraint existed carry a plain taxid index instead
+            has_taxid_index = session.run("""
+                SHOW INDEXES YIELD labelsOrTypes, properties
+                WHERE labelsOrTypes = ['Taxon'] AND properties = ['taxid']
+                RETURN count(*) > 0 as indexed
+            """).single()['indexed']
+            if not has_taxid_index:
+                session.run(TAXID_CONSTRAINT_QUERY).consume()
+            
+            session.run(NAMES_FULLTEXT_INDEX_QUERY).consume()
+        print("✅ Taxon indexes in place")
+    
     def is_database_empty(self) -> bool:
         """Check if the database has any taxonomy data"""
+        # Data doesn't disappear on its own, so a populated database is remembered until
+        # clear_cache(); an empty one is rechecked once the TTL runs out
+        if self._has_data:
+            return False
+        if self._empty_checked_at is not None and time.monotonic() - self._empty_checked_at < EMPTY_CHECK_TTL:
+            return True
+        
         try:
-            with self.driver.session() as session:
-                result = session.run("MATCH (n:Taxon) RETURN count(n) as count LIMIT 1")
-                count = result.single()['count']
-                return count == 0
+            count = self._read("MATCH (n:Taxon) RETURN count(n) as count LIMIT 1")[0]['count']
         except Exception:
             return True  # Assume empty if we can't check
+        
+        self._has_data = count > 0
+        self._empty_checked_at = time.monotonic()
+        return not self._has_data
     
     def get_species_lineage(self, taxid: int) -> List[Dict]:
         """Get the complete lineage of a species from itself up to root"""
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (species:Taxon {taxid: $taxid})
-                MATCH path = (species)<-[:PARENT_OF*]-(ancestor)
-                WITH nodes(path) as lineage_nodes
-                UNWIND lineage_nodes as node
-                RETURN DISTINCT 
-                    node.taxid as taxid,
-                    node.scientific_name as scientific_name,
-                    node.common_name as common_name,
-                    node.rank as rank
-                """
-            , taxid=taxid)
-            
-            lineage = []
-            for record in result:
-                lineage.append({
-                    'taxid': record['taxid'],
-                    'scientific_name': record['scientific_name'],
-                    'common_name': record['common_name'],
-                    'rank': record['rank'],
-                    'display_name': record['common_name'] or record['scientific_name']
-                })
-            
-            return lineage
+        return self._lineage_cache(taxid)
+    
+    def _query_species_lineage(self, taxid: int) -> List[Dict]:
+        lineages = self._fetch_materialized_lineages([taxid])
+        if taxid not in lineages:
+            return []
+        
+        if lineages[taxid] is not None:
+            return [
+                {**node, 'display_name': node['common_name'] or node['scientific_name']}
+                for node in lineages[taxid]
+            ]
+        
+        # Only species carry a materialized lineage; walk the tree for other ranks
+        return self._read_taxa("""
+            MATCH (species:Taxon {taxid: $taxid})
+            // Bounded quantified path (Neo4j 5.9+); NCBI lineages are far shallower than 64.
+            // Only the single path reaching the root is kept, so its nodes are already
+            // unique and ordered from the species upwards
+            MATCH path = (species)<-[:PARENT_OF]-{0,64}(root)
+            WHERE NOT ()-[:PARENT_OF]->(root)
+            UNWIND nodes(path) as node
+            RETURN node.taxid as taxid,
+                node.scientific_name as scientific_name,
+                node.common_name as common_name,
+                node.rank as rank
+            """
+        , taxid=taxid)
     
     def search_species_by_name(self, search_query: str, limit: int = 10) -> List[Dict]:
         """Search for species by name using full-text search for better relevance"""
-        with self.driver.session() as session:
-            try:
-                # Try full-text search first for better relevance
-                result = session.run("""
-                    CALL db.index.fulltext.queryNodes("taxon_names_fulltext", $search_query) 
-                    YIELD node, score
-                    WHERE node.rank = 'species'
-                    WITH node, score,
-                         CASE 
-                             WHEN toLower(node.common_name) = toLower($search_query) THEN 100 + score
-                             WHEN toLower(node.scientific_name) = toLower($search_query) THEN 90 + score
-                             WHEN toLower(node.common_name) STARTS WITH toLower($search_query) THEN 80 + score
-                             WHEN toLower(node.scientific_name) STARTS WITH toLower($search_query) THEN 70 + score
-                             ELSE score
-                         END as final_score
-                    RETURN node.taxid as taxid,
-                           node.scientific_name as scientific_name,
-                           node.common_name as common_name,
-                           node.rank as rank
-                    ORDER BY final_score DESC
-                    LIMIT $limit
-                """, search_query=search_query, limit=limit)
-            except:
-                # Fallback to original search if full-text index not available
-                result = session.run("""
-                    MATCH (t:Taxon)
-                    WHERE (toLower(t.scientific_name) CONTAINS toLower($search_query) 
-                        OR toLower(t.common_name) CONTAINS toLower($search_query))
-                    AND t.rank = 'species'
-                    RETURN t.taxid as taxid,
-                           t.scientific_name as scientific_name,
-                           t.common_name as common_name,
-                           t.rank as rank
-                    ORDER BY 
-                        CASE 
-                            WHEN toLower(t.common_name) = toLower($search_query) THEN 1
-                            WHEN toLower(t.scientific_name) = toLower($search_query) THEN 2
-                            WHEN toLower(t.common_name) STARTS WITH toLower($search_query) THEN 3
-                            WHEN toLower(t.scientific_name) STARTS WITH toLower($search_query) THEN 4
-                            ELSE 5
-                        END,
-                        t.scientific_name
-                    LIMIT $limit
-                """, search_query=search_query, limit=limit)
-            
-            species = []
-            for record in result:
-                species.append({
-                    'taxid': record['taxid'],
-                    'scientific_name': record['scientific_name'],
-                    'common_name': record['common_name'],
-                    'rank': record['rank'],
-                    'display_name': record['common_name'] or record['scientific_name']
-                })
-            
-            return species
+        # Lucene operators in user input would otherwise be parsed as query syntax
+        escaped_query = LUCENE_SPECIAL_CHARS.sub(r'\\\1', search_query.lower())
+        # Prefix matches for type-ahead, plus a phrase clause that lifts exact names to the top
+        lucene_query = f'{escaped_query}* OR "{escaped_query}"~1'
+        return self._read_taxa("""
+            CALL db.index.fulltext.queryNodes("taxon_names_fulltext", $lucene_query) 
+            YIELD node, score
+            WHERE node.rank = 'species'
+            RETURN node.taxid as taxid,
+                   node.scientific_name as scientific_name,
+                   node.common_name as common_name,
+                   node.rank as rank
+            ORDER BY score DESC
+            LIMIT $limit
+        """, lucene_query=lucene_query, limit=limit)
     
     def get_sample_species(self, limit: int = 20) -> List[Dict]:
         """Get a sample of interesting species for initial display"""
-        # Some well-known taxids for common species
-        sample_taxids = [
-            9606,   # Human
-            9615,   # Dog  
-            9685,   # Cat
-            9796,   # Horse
-            9913,   # Cow
-            9031,   # Chicken
-            8030,   # Salmon
-            7227,   # Fruit fly
-            4932,   # Yeast
-            562     # E. coli
-        ]
-        
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (t:Taxon)
-                WHERE t.taxid IN $taxids AND t.rank = 'species'
-                RETURN t.taxid as taxid,
-                       t.scientific_name as scientific_name,
-                       t.common_name as common_name,
-                       t.rank as rank
-                ORDER BY t.scientific_name
-            """, taxids=sample_taxids)
-            
-            species = []
-            for record in result:
-                species.append({
-                    'taxid': record['taxid'],
-                    'scientific_name': record['scientific_name'],
-                    'common_name': record['common_name'],
-                    'rank': record['rank'],
-                    'display_name': record['common_name'] or record['scientific_name']
-                })
-            
-            return species
+        return self._sample_cache(limit)
+    
+    def _query_sample_species(self, limit: int) -> List[Dict]:
+        return self._read_taxa("""
+            MATCH (t:Taxon)
+            WHERE t.taxid IN $taxids AND t.rank = 'species'
+            RETURN t.taxid as taxid,
+                   t.scientific_name as scientific_name,
+                   t.common_name as common_name,
+                   t.rank as rank
+            ORDER BY t.scientific_name
+            LIMIT $limit
+        """, taxids=SAMPLE_TAXIDS, limit=limit)
     
     def get_comparative_lineage(self, taxid1: int, taxid2: int) -> Dict:
         """Get comparative lineage between two species, showing shared and unique ancestors"""
-        with self.driver.session() as session:
-            result = session.run("""
-                MATCH (s1:Taxon {taxid: $taxid1})
-                MATCH (s1)<-[:PARENT_OF*0..]-(l1)
-                WITH s1, collect(DISTINCT l1) as lineage1
-                MATCH (s2:Taxon {taxid: $taxid2})
-                MATCH (s2)<-[:PARENT_OF*0..]-(l2)
-                WITH s1, lineage1, s2, collect(DISTINCT l2) as lineage2
-                RETURN s1, s2, lineage1, lineage2,
-                       [x IN lineage1 WHERE x IN lineage2] as common_data
-            """, taxid1=taxid1, taxid2=taxid2)
-            
-            record = result.single()
-            if not record:
-                return {"error": "Species not found"}
+        # (A, B) and (B, A) share one cache entry; the sides are swapped back on the way out
+        if taxid1 <= taxid2:
+            return self._comparison_cache(taxid1, taxid2)
+        
+        comparison = self._comparison_cache(taxid2, taxid1)
+        if 'error' in comparison:
+            return comparison
+        return {
+            'species1': comparison['species2'],
+            'species2': comparison['species1'],
+            'comparison': comparison['comparison']
+        }
+    
+    def compare_with_human(self, taxid: int) -> Dict:
+        """Compare a species with human using the shared ancestors precomputed at import"""
+        return self._human_comparison_cache(taxid)
+    
+    def _query_human_comparison(self, taxid: int) -> Dict:
+        records = self._read("""
+            MATCH (t:Taxon {taxid: $taxid})
+            RETURN t.taxid as taxid,
+                   t.lineage_taxids as lineage_taxids,
+                   t.lineage_names as lineage_names,
+                   t.lineage_common_names as lineage_common_names,
+                   t.lineage_ranks as lineage_ranks,
+                   t.shared_with_human as shared_with_human,
+                   t.mrca_with_human as mrca_with_human
+        """, taxid=taxid)
+        if not records:
+            return {"error": "Species not found"}
+        
+        record = records[0]
+        human_lineage = self.get_species_lineage(HUMAN_TAXID)
+        # Non-species taxa and databases imported before these properties existed
+        if record['shared_with_human'] is None or record['lineage_taxids'] is None or not human_lineage:
+            return self.get_comparative_lineage(taxid, HUMAN_TAXID)
+        
+        lineage = self._materialized_lineage(record)
+        mrca = next((node for node in lineage if node['taxid'] == record['mrca_with_human']), None)
+        return self._build_comparison(
+            lineage[0], human_lineage[0], lineage, human_lineage, set(record['shared_with_human']), mrca
+        )
+    
+    def get_comparative_lineages(self, pairs: List[Tuple[int, int]]) -> List[Dict]:
+        """Compare many species pairs with batched queries instead of one per pair, preserving input order"""
+        return self._query_comparative_lineages(pairs)
+    
+    def _query_comparative_lineage(self, taxid1: int, taxid2: int) -> Dict:
+        return self._query_comparative_lineages([(taxid1, taxid2)])[0]
+    
+    def _query_comparative_lineages(self, pairs: List[Tuple[int, int]]) -> List[Dict]:
+        lineages = self._fetch_materialized_lineages({taxid for pair in pairs for taxid in pair})
+        
+        comparisons = {}
+        traversal_pairs = []
+        for pair in pairs:
+            taxid1, taxid2 = pair
+            if taxid1 not in lineages or taxid2 not in lineages:
+                continue
             
-            # Single mapping function - convert Node to our final format
-            def to_lineage_item(node, common_taxids):
-                return {
-                    'taxid': node['taxid'],
-                    'scientific_name': node['scientific_name'],
-                    'common_name': node['common_name'],
-                    'rank': node['rank'],
-                    'shared': node['taxid'] in common_taxids,
-                    'display_name': node['common_name'] or node['scientific_name']
-                }
+            lineage1, lineage2 = lineages[taxid1], lineages[taxid2]
+            if lineage1 is None or lineage2 is None:
+                traversal_pairs.append(pair)
+                continue
             
-            # Extract data once
-            s1, s2 = record['s1'], record['s2']
-            common_taxids = {node['taxid'] for node in record['common_data']}
+            # Root-first lineages of a tree agree up to the MRCA: the shared part is their common prefix
+            prefix = 0
+            for node1, node2 in zip(reversed(lineage1), reversed(lineage2)):
+                if node1['taxid'] != node2['taxid']:
+                    break
+                prefix += 1
             
-            # Rank order for sorting
-            rank_order = {
-                'species': 1, 'genus': 2, 'subfamily': 3, 'family': 4, 'suborder': 5,
-                'order': 6, 'superorder': 7, 'class': 8, 'phylum': 9, 'kingdom': 10,
-                'superkingdom': 11, 'domain': 12, 'cellular root': 13, 'no rank': 14
+            common_taxids = {node['taxid'] for node in lineage1[len(lineage1) - prefix:]}
+            mrca = lineage1[len(lineage1) - prefix] if prefix else None
+            comparisons[tuple(pair)] = self._build_comparison(
+                lineage1[0], lineage2[0], lineage1, lineage2, common_taxids, mrca
+            )
+        
+        if traversal_pairs:
+            comparisons.update(self._traverse_comparative_lineages(traversal_pairs))
+        
+        return [comparisons.get(tuple(pair), {"error": "Species not found"}) for pair in pairs]
+    
+    def _fetch_materialized_lineages(self, taxids) -> Dict[int, Optional[List[Dict]]]:
+        """Read the precomputed lineage of each taxon, species first; None where not materialized"""
+        records = self._read("""
+            UNWIND $taxids as taxid
+            MATCH (t:Taxon {taxid: taxid})
+            RETURN t.taxid as taxid,
+                   t.lineage_taxids as lineage_taxids,
+                   t.lineage_names as lineage_names,
+                   t.lineage_common_names as lineage_common_names,
+                   t.lineage_ranks as lineage_ranks
+        """, taxids=list(taxids))
+        
+        return {
+            record['taxid']: self._materialized_lineage(record) if record['lineage_taxids'] is not None else None
+            for record in records
+        }
+    
+    def _materialized_lineage(self, record) -> List[Dict]:
+        """Unpack the stored lineage lists of a taxon into lineage entries"""
+        # Stored root first; the API lists a lineage from the species upwards
+        return [
+            {
+                'taxid': taxid,
+                'scientific_name': scientific_name,
+                'common_name': common_name or None,
+                'rank': rank
             }
+            for taxid, scientific_name, common_name, rank in zip(
+                reversed(record['lineage_taxids']),
+                reversed(record['lineage_names']),
+                reversed(record['lineage_common_names']),
+                reversed(record['lineage_ranks'])
+            )
+        ]
+    
+    def _traverse_comparative_lineages(self, pairs: List[Tuple[int, int]]) -> Dict[Tuple[int, int], Dict]:
+        """Compare pairs by walking the tree, for taxa without a materialized lineage"""
+        records = self._read("""
+            UNWIND $pairs as pair
+            MATCH (s1:Taxon {taxid: pair[0]})
+            // Bounded quantified path (Neo4j 5.9+); NCBI lineages are far shallower than 64
+            MATCH path1 = (s1)<-[:PARENT_OF]-{0,64}(l1)
+            // Deepest first; databases imported before depth was stored fall back to path length
+            WITH pair, s1, l1 ORDER BY coalesce(l1.depth, -length(path1)) DESC
+            WITH pair, s1, collect({
+                taxid: l1.taxid, scientific_name: l1.scientific_name,
+                common_name: l1.common_name, rank: l1.rank
+            }) as lineage1
+            MATCH (s2:Taxon {taxid: pair[1]})
+            MATCH path2 = (s2)<-[:PARENT_OF]-{0,64}(l2)
+            WITH pair, s1, lineage1, s2, l2 ORDER BY coalesce(l2.depth, -length(path2)) DESC
+            WITH pair, s1, lineage1, s2, collect({
+                taxid: l2.taxid, scientific_name: l2.scientific_name,
+                common_name: l2.common_name, rank: l2.rank
+            }) as lineage2
+            // Only the fields the payload uses go over the wire, not whole nodes
+            RETURN pair,
+                   s1 {.taxid, .scientific_name, .common_name} as s1,
+                   s2 {.taxid, .scientific_name, .common_name} as s2,
+                   lineage1, lineage2
+        """, pairs=[list(pair) for pair in pairs])
+        
+        comparisons = {}
+        for record in records:
+            # Shared ancestors are a hashed set intersection on taxids
+            common_taxids = {node['taxid'] for node in record['lineage1']}
+            common_taxids.intersection_update(node['taxid'] for node in record['lineage2'])
+            # Lineages come back deepest first, so the first shared node is the most recent common ancestor
+            mrca = next((node for node in record['lineage1'] if node['taxid'] in common_taxids), None)
             
-            # Single transformation: Node -> final format, sorted
-            lineage1 = [to_lineage_item(node, common_taxids) for node in record['lineage1']]
-            lineage2 = [to_lineage_item(node, common_taxids) for node in record['lineage2']]
-
-            # Most recent common ancestor
-            if record['common_data']:
-                mrca = min(record['common_data'], key=lambda x: rank_order.get(x['rank'], 15))
-                common_ancestor = {
-                    'taxid': mrca['taxid'],
-                    'rank': mrca['rank'], 
-                    'name': mrca['common_name'] or mrca['scientific_name']
-                }
-            else:
-                common_ancestor = None
-            
+            comparisons[tuple(record['pair'])] = self._build_comparison(
+                record['s1'], record['s2'], record['lineage1'], record['lineage2'], common_taxids, mrca
+            )
+        
+        return comparisons
+    
+    def _build_comparison(self, s1, s2, lineage1_nodes, lineage2_nodes, common_taxids, mrca) -> Dict:
+        """Turn two lineages into the comparison payload, flagging shared ancestors"""
+        # Single mapping function - convert a lineage entry to our final format
+        def to_lineage_item(node, common_taxids):
             return {
-                'species1': {
-                    'taxid': s1['taxid'],
-                    'scientific_name': s1['scientific_name'],
-                    'common_name': s1['common_name'],
-                    'display_name': s1['common_name'] or s1['scientific_name'],
-                    'lineage': lineage1
-                },
-                'species2': {
-                    'taxid': s2['taxid'],
-                    'scientific_name': s2['scientific_name'], 
-                    'common_name': s2['common_name'],
-                    'display_name': s2['common_name'] or s2['scientific_name'],
-                    'lineage': lineage2
-                },
-                'comparison': {
-                    'common_ancestor': common_ancestor,
-                    'total_common_ancestors': len(record['common_data'])
-                }
+                'taxid': node['taxid'],
+                'scientific_name': node['scientific_name'],
+                'common_name': node['common_name'],
+                'rank': node['rank'],
+                'shared': node['taxid'] in common_taxids,
+                'display_name': node['common_name'] or node['scientific_name']
+            }
+        
+        # Single transformation: Node -> final format
+        lineage1 = [to_lineage_item(node, common_taxids) for node in lineage1_nodes]
+        lineage2 = [to_lineage_item(node, common_taxids) for node in lineage2_nodes]
+
+        # Most recent common ancestor
+        if mrca is not None:
+            common_ancestor = {
+                'taxid': mrca['taxid'],
+                'rank': mrca['rank'], 
+                'name': mrca['common_name'] or mrca['scientific_name']
+            }
+        else:
+            common_ancestor = None
+        
+        return {
+            'species1': {
+                'taxid': s1['taxid'],
+                'scientific_name': s1['scientific_name'],
+                'common_name': s1['common_name'],
+                'display_name': s1['common_name'] or s1['scientific_name'],
+                'lineage': lineage1
+            },
+            'species2': {
+                'taxid': s2['taxid'],
+                'scientific_name': s2['scientific_name'], 
+                'common_name': s2['common_name'],
+                'display_name': s2['common_name'] or s2['scientific_name'],
+                'lineage': lineage2
+            },
+            'comparison': {
+                'common_ancestor': common_ancestor,
+                'total_common_ancestors': len(common_taxids)
             }
+        }
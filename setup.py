@@ -7,11 +7,64 @@ This ensures we have complete taxonomic relationships without missing links.
 import os
 import sys
 import tarfile
+import csv
+import mmap
 import requests
 import tempfile
 import shutil
-from typing import Dict, List, Optional
-from neo4j import GraphDatabase
+import threading
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from neo4j import GraphDatabase, READ_ACCESS
+from neo4j.exceptions import ClientError
+from models import TAXID_CONSTRAINT_QUERY, NAMES_FULLTEXT_INDEX_QUERY, HUMAN_TAXID
+
+# Concurrent sessions used to create nodes and PARENT_OF edges
+IMPORT_WRITERS = int(os.getenv('NEO4J_IMPORT_WRITERS', '4'))
+
+# A child is locked by its own edge and by its children's, which other writers may hold,
+# so parallel edge batches can deadlock. Smaller batches hold fewer locks and lose less
+# work per retry, and execute_write keeps retrying them for well beyond the driver's
+# default 30s budget, since a full NCBI load keeps the writers contending for minutes
+PARALLEL_EDGE_BATCH_SIZE = 2000
+IMPORT_MAX_RETRY_TIME = 600
+
+# Bytes read from the taxdump download per call while extracting
+DOWNLOAD_READ_SIZE = 1024 * 1024
+
+# Written to NEO4J_IMPORT_DIR, when set, for the server to read edges with LOAD CSV
+EDGES_CSV = 'taxon_edges.csv'
+
+def read_dmp_rows(path: str):
+    """Yield the fields of each row of an NCBI .dmp file, as undecoded bytes"""
+    with open(path, 'rb') as f:
+        # mmap refuses to map an empty file, and there are no rows to yield anyway
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                # Rows are read front to back once: aggressive readahead, early page reuse
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            # mmap.readline finds each newline with memchr over the mapping, with no
+            # text-mode decoding or newline translation of the whole file
+            for line in iter(mm.readline, b''):
+                # One C-level pass drops the newline and the closing "\t|"; trailing empty
+                # fields go with it, but the parsers only read the leading ones
+                yield line.rstrip(b' \t|\r\n').split(b'\t|\t')
+
+def prefetch_file(path: str):
+    """Hint the kernel to read a file into the page cache in the background"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
 
 class NCBIToNeo4jMigrator:
     def __init__(self):
@@ -22,8 +75,12 @@ class NCBIToNeo4jMigrator:
         neo4j_uri = os.getenv('NEO4J_URI', 'bolt://localhost:7687')
         neo4j_user = os.getenv('NEO4J_USERNAME', 'neo4j')
         neo4j_password = os.getenv('NEO4J_PASSWORD', 'neotaxonomy')
+        self.database = os.getenv('NEO4J_DATABASE', 'neo4j')
         
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+        self.driver = GraphDatabase.driver(
+            neo4j_uri, auth=(neo4j_user, neo4j_password),
+            max_transaction_retry_time=IMPORT_MAX_RETRY_TIME
+        )
         print(f"Connected to Neo4j at {neo4j_uri}")
         
     def download_ncbi_taxonomy(self) -> str:
@@ -33,113 +90,138 @@ class NCBIToNeo4jMigrator:
         
         response = requests.get(self.ncbi_ftp_url, stream=True)
         response.raise_for_status()
+        response.raw.decode_content = True
         
-        tar_path = os.path.join(self.temp_dir, "taxdump.tar.gz")
-        
-        # Download with progress indication
-        total_size = int(response.headers.get('content-length', 0))
-        downloaded = 0
+        # Extract straight from the response stream; the archive never touches disk.
+        # Only the two dump files the importer reads are written out. Reading 1MB at a
+        # time instead of tarfile's default 10KB lets the socket buffer fill while each
+        # block is decompressed, with far fewer read calls
+        with tarfile.open(fileobj=response.raw, mode='r|gz', bufsize=DOWNLOAD_READ_SIZE) as tar:
+            for member in tar:
+                if member.name in ("nodes.dmp", "names.dmp"):
+                    tar.extract(member, self.temp_dir, filter='data')
         
-        with open(tar_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_size > 0:
-                        percent = (downloaded / total_size) * 100
-                        print(f"\rProgress: {percent:.1f}%", end="", flush=True)
-        
-        print("\nDownload complete. Extracting...")
-        
-        # Extract the tar file
-        with tarfile.open(tar_path, 'r:gz') as tar:
-            tar.extractall(self.temp_dir)
+        print("Download and extraction complete")
         
         return self.temp_dir
     
-    def parse_nodes_file(self, nodes_path: str) -> Dict[int, Dict]:
-        """Parse the nodes.dmp file to get taxonomy hierarchy"""
+    def parse_nodes_file(self, nodes_path: str) -> Tuple[Dict[int, Optional[int]], Dict[int, str]]:
+        """Parse the nodes.dmp file into parent and rank columns keyed by taxid"""
         print("Parsing taxonomy nodes...")
         
-        nodes = {}
-        with open(nodes_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f):
-                if line_num % 100000 == 0:
-                    print(f"\rProcessed {line_num:,} nodes", end="", flush=True)
-                
-                # NCBI format: taxid | parent_taxid | rank | ... (separated by \t|\t)
-                line = line.strip()
-                if line.endswith('\t|'):
-                    line = line[:-2]  # Remove trailing \t|
-                
-                parts = line.split('\t|\t')
-                if len(parts) >= 3:
-                    try:
-                        taxid = int(parts[0].strip())
-                        parent_taxid = int(parts[1].strip())
-                        rank = parts[2].strip()
-                        
-                        nodes[taxid] = {
-                            'parent_taxid': parent_taxid if parent_taxid != taxid else None,
-                            'rank': rank
-                        }
-                    except ValueError:
-                        continue  # Skip malformed lines
-        
-        print(f"\nParsed {len(nodes):,} taxonomy nodes")
-        return nodes
+        # One flat dict per column rather than a small dict per taxon, which on
+        # millions of taxa is mostly per-object overhead
+        parents = {}
+        ranks = {}
+        # Only a few dozen distinct ranks exist: decode each once and share the string
+        rank_names = {}
+        # NCBI format: taxid | parent_taxid | rank | ... (separated by \t|\t)
+        for parts in read_dmp_rows(nodes_path):
+            if len(parts) >= 3:
+                try:
+                    taxid = int(parts[0])
+                    parent_taxid = int(parts[1])
+                    
+                    parents[taxid] = parent_taxid if parent_taxid != taxid else None
+                    rank = rank_names.get(parts[2])
+                    if rank is None:
+                        rank = rank_names[parts[2]] = parts[2].decode()
+                    ranks[taxid] = rank
+                except ValueError:
+                    continue  # Skip malformed lines
+        
+        print(f"Parsed {len(parents):,} taxonomy nodes")
+        return parents, ranks
     
-    def parse_names_file(self, names_path: str) -> Dict[int, Dict]:
-        """Parse the names.dmp file to get scientific and common names"""
+    def parse_names_file(self, names_path: str, taxids=None) -> Tuple[Dict[int, Optional[str]], Dict[int, str]]:
+        """Parse the names.dmp file into scientific and common name columns keyed by taxid"""
         print("Parsing taxonomy names...")
         
-        names = {}
-        with open(names_path, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f):
-                if line_num % 100000 == 0:
-                    print(f"\rProcessed {line_num:,} names", end="", flush=True)
-                
-                # NCBI format: taxid | name | unique_name | name_class | (separated by \t|\t)
-                line = line.strip()
-                if line.endswith('\t|'):
-                    line = line[:-2]  # Remove trailing \t|
-                
-                parts = line.split('\t|\t')
-                if len(parts) >= 4:
-                    try:
-                        taxid = int(parts[0].strip())
-                        name = parts[1].strip()
-                        name_class = parts[3].strip()
-                        
-                        if taxid not in names:
-                            names[taxid] = {}
-                        
-                        if name_class == "scientific name":
-                            names[taxid]['scientific_name'] = name
-                        elif name_class == "common name":
-                            # Only store the first common name we encounter
-                            if 'common_name' not in names[taxid]:
-                                names[taxid]['common_name'] = name
-                    except ValueError:
-                        continue  # Skip malformed lines
-        
-        print(f"\nParsed names for {len(names):,} taxa")
-        return names
+        # Nearly every taxon has a scientific name, so when the taxids are known the dict is
+        # built at full size up front instead of resizing its way through millions of inserts;
+        # a None value means no scientific name was found
+        scientific_names = dict.fromkeys(taxids) if taxids is not None else {}
+        common_names = {}
+        # One dict lookup on the raw name class picks the column a row fills
+        name_columns = {b"scientific name": scientific_names, b"common name": common_names}
+        # NCBI format: taxid | name | unique_name | name_class | (separated by \t|\t)
+        for parts in read_dmp_rows(names_path):
+            # Most rows are synonyms and other classes; drop them before any int or UTF-8 decoding
+            column = name_columns.get(parts[3]) if len(parts) >= 4 else None
+            if column is None:
+                continue
+            
+            try:
+                taxid = int(parts[0])
+                # Only store the first name of each class we encounter; NCBI gives
+                # every taxon exactly one scientific name
+                if column.get(taxid) is None:
+                    column[taxid] = parts[1].decode()
+            except ValueError:
+                continue  # Skip malformed lines
+        
+        named = sum(name is not None for name in scientific_names.values())
+        print(f"Parsed names for {named:,} taxa")
+        return scientific_names, common_names
+    
+    def compute_depths(self, parents: Dict[int, Optional[int]]) -> Dict[int, int]:
+        """Distance of every taxon from the root, filled in one pass by memoizing ancestors"""
+        depths = {}
+        for taxid in parents:
+            # Climb until we hit the root or a taxon whose depth is already known
+            path = []
+            current = taxid
+            while current is not None and current in parents and current not in depths:
+                path.append(current)
+                current = parents[current]
+            
+            depth = depths.get(current, -1)
+            for ancestor in reversed(path):
+                depth += 1
+                depths[ancestor] = depth
+        
+        return depths
+    
+    def get_lineage_taxids(self, taxid: int, parents: Dict[int, Optional[int]]) -> List[int]:
+        """Follow parent links from a taxon up to the root, returned root first"""
+        lineage = [taxid]
+        parent_taxid = parents[taxid]
+        while parent_taxid is not None and parent_taxid in parents:
+            lineage.append(parent_taxid)
+            parent_taxid = parents[parent_taxid]
+        
+        lineage.reverse()
+        return lineage
+    
+    def get_shared_lineage(self, lineage: List[int], other_lineage) -> List[int]:
+        """Ancestors of a root-first lineage that also appear in another lineage's taxids"""
+        # Lineages are root first, so the shared ancestors form a prefix ending at the MRCA
+        return [t for t in lineage if t in other_lineage]
     
     def clear_existing_data(self):
         """Clear existing data from Neo4j database"""
         print("Clearing existing Neo4j data...")
         
-        with self.driver.session() as session:
-            # Delete all relationships first
-            session.run("MATCH ()-[r:PARENT_OF]->() DELETE r")
-            
-            # Delete all nodes
-            session.run("MATCH (n:Taxon) DELETE n")
+        with self.driver.session(database=self.database) as session:
+            # Fresh deployments start empty; one node probe spares them the delete scan
+            if session.run("MATCH (n:Taxon) RETURN n.taxid LIMIT 1").single() is None:
+                print("Database is empty, no nodes to delete.")
+            else:
+                # Delete nodes with their relationships, committing every 10k nodes so the
+                # server never holds the whole taxonomy in one transaction
+                session.run("""
+                    MATCH (n:Taxon)
+                    CALL (n) {
+                        DETACH DELETE n
+                    } IN TRANSACTIONS OF 10000 ROWS
+                """).consume()
             
-            # Drop any indexes (if they exist)
+            # Drop any indexes (if they exist), even on an empty database: one emptied with a
+            # plain DETACH DELETE keeps its indexes, and a legacy taxid index would block
+            # the constraint created by create_indexes()
             try:
                 session.run("DROP INDEX taxon_taxid_index IF EXISTS")
+                session.run("DROP CONSTRAINT taxon_taxid IF EXISTS")
             except:
                 pass
                 
@@ -149,18 +231,15 @@ class NCBIToNeo4jMigrator:
         """Create indexes for better performance"""
         print("Creating database indexes...")
         
-        with self.driver.session() as session:
-            # Create index on taxid for fast lookups
-            session.run("CREATE INDEX taxon_taxid_index IF NOT EXISTS FOR (t:Taxon) ON (t.taxid)")
+        with self.driver.session(database=self.database) as session:
+            # Unique constraint on taxid; its backing index serves the lookups
+            session.run(TAXID_CONSTRAINT_QUERY)
             
             # Create index on scientific_name for searches
             session.run("CREATE INDEX taxon_name_index IF NOT EXISTS FOR (t:Taxon) ON (t.scientific_name)")
             
             # Create full-text index for better search relevance
-            session.run("""
-                CREATE FULLTEXT INDEX taxon_names_fulltext IF NOT EXISTS 
-                FOR (t:Taxon) ON EACH [t.scientific_name, t.common_name]
-            """)
+            session.run(NAMES_FULLTEXT_INDEX_QUERY)
             
         print("Indexes created.")
     
@@ -173,8 +252,11 @@ class NCBIToNeo4jMigrator:
             raise FileNotFoundError("Required NCBI files not found in extracted archive")
         
         # Parse the files
-        nodes = self.parse_nodes_file(nodes_path)
-        names = self.parse_names_file(names_path)
+        # names.dmp is parsed second because it is presized from the nodes' taxids; ask the
+        # kernel to start reading it now so its disk reads overlap parsing nodes.dmp
+        prefetch_file(names_path)
+        parents, ranks = self.parse_nodes_file(nodes_path)
+        scientific_names, common_names = self.parse_names_file(names_path, parents)
         
         # Clear existing data and create indexes
         self.clear_existing_data()
@@ -183,110 +265,217 @@ class NCBIToNeo4jMigrator:
         # Prepare bulk insert data for nodes
         print("Loading taxonomy nodes into Neo4j...")
         
-        total_nodes = len(nodes)
+        total_nodes = len(parents)
         chunk_size = 10000
+        depths = self.compute_depths(parents)
+        human_lineage = set(self.get_lineage_taxids(HUMAN_TAXID, parents)) if HUMAN_TAXID in parents else None
+        
+        # Species carry their lineage (root first) so lookups need no traversal;
+        # null lineage properties on other ranks are simply not stored
+        create_nodes_query = """
+            UNWIND $nodes as node
+            CREATE (t:Taxon {
+                taxid: node.taxid,
+                scientific_name: node.scientific_name,
+                common_name: node.common_name,
+                rank: node.rank,
+                depth: node.depth,
+                lineage_taxids: node.lineage_taxids,
+                lineage_names: node.lineage_names,
+                lineage_common_names: node.lineage_common_names,
+                lineage_ranks: node.lineage_ranks,
+                shared_with_human: node.shared_with_human,
+                mrca_with_human: node.mrca_with_human
+            })
+            RETURN t.taxid as taxid, elementId(t) as element_id
+        """
         
-        with self.driver.session() as session:
+        # Element ids of the created nodes, so edges can be created without index lookups
+        element_ids = {}
+        # Edges are staged as (parent, child) taxids in the same pass that builds the nodes,
+        # partitioned by parent: a parent's many edges, and so most lock contention, stay
+        # inside one relationship writer
+        # Each partition is a pair of int32 arrays (parents, children): 8 bytes per edge
+        # instead of a tuple of two boxed ints
+        edge_partitions = [(array('i'), array('i')) for _ in range(IMPORT_WRITERS)]
+        
+        def create_node_batch(batch):
+            with self.driver.session(database=self.database) as session:
+                return session.execute_write(lambda tx: tx.run(create_nodes_query, nodes=batch).values())
+        
+        # Batches commit on a pool of sessions while the next ones are being built; new nodes
+        # lock nothing shared, so node batches can run concurrently without deadlocks
+        with ThreadPoolExecutor(max_workers=IMPORT_WRITERS) as executor:
+            pending = deque()
+            
+            def submit_node_batch(batch):
+                # Bound the batches in flight so built rows don't pile up in memory
+                if len(pending) >= IMPORT_WRITERS * 2:
+                    element_ids.update(pending.popleft().result())
+                pending.append(executor.submit(create_node_batch, batch))
+            
             # Create all nodes first (without relationships)
             node_data = []
-            for i, (taxid, node_info) in enumerate(nodes.items()):
+            for i, (taxid, rank) in enumerate(ranks.items()):
                 if i % chunk_size == 0 and i > 0:
                     # Insert this chunk
                     progress = (i / total_nodes) * 100
                     print(f"\rCreating nodes: {progress:.1f}% ({i:,}/{total_nodes:,})", end="", flush=True)
                     
-                    session.run("""
-                        UNWIND $nodes as node
-                        CREATE (:Taxon {
-                            taxid: node.taxid,
-                            scientific_name: node.scientific_name,
-                            common_name: node.common_name,
-                            rank: node.rank
-                        })
-                    """, nodes=node_data)
+                    submit_node_batch(node_data)
                     
                     node_data = []
                 
-                scientific_name = names.get(taxid, {}).get('scientific_name', f'Unknown_{taxid}')
-                common_name = names.get(taxid, {}).get('common_name')
-                
-                node_data.append({
+                node_entry = {
                     'taxid': taxid,
-                    'scientific_name': scientific_name,
-                    'common_name': common_name,
-                    'rank': node_info['rank']
-                })
+                    'scientific_name': scientific_names.get(taxid) or f'Unknown_{taxid}',
+                    'common_name': common_names.get(taxid),
+                    'rank': rank,
+                    'depth': depths[taxid]
+                }
+                
+                if rank == 'species':
+                    lineage = self.get_lineage_taxids(taxid, parents)
+                    # Neo4j lists cannot hold nulls, so missing common names are stored as ''
+                    node_entry['lineage_taxids'] = lineage
+                    node_entry['lineage_names'] = [
+                        scientific_names.get(t) or f'Unknown_{t}' for t in lineage
+                    ]
+                    node_entry['lineage_common_names'] = [common_names.get(t, '') for t in lineage]
+                    node_entry['lineage_ranks'] = [ranks[t] for t in lineage]
+                    
+                    if human_lineage is not None:
+                        shared = self.get_shared_lineage(lineage, human_lineage)
+                        node_entry['shared_with_human'] = shared
+                        node_entry['mrca_with_human'] = shared[-1] if shared else None
+                
+                node_data.append(node_entry)
+                
+                # Skip the root, and parents missing from the dump as the MATCH-based load did
+                parent_taxid = parents[taxid]
+                if parent_taxid and parent_taxid != taxid and parent_taxid in parents:
+                    partition_parents, partition_children = edge_partitions[parent_taxid % IMPORT_WRITERS]
+                    partition_parents.append(parent_taxid)
+                    partition_children.append(taxid)
             
             # Insert remaining nodes
             if node_data:
-                session.run("""
-                    UNWIND $nodes as node
-                    CREATE (:Taxon {
-                        taxid: node.taxid,
-                        scientific_name: node.scientific_name,
-                        common_name: node.common_name,
-                        rank: node.rank
-                    })
-                """, nodes=node_data)
+                submit_node_batch(node_data)
+            
+            while pending:
+                element_ids.update(pending.popleft().result())
         
         print(f"\nCreated {total_nodes:,} taxonomy nodes")
         
         # Create relationships
         print("Creating parent-child relationships...")
+        if not self.load_relationships_from_csv(edge_partitions, element_ids, chunk_size):
+            self.create_relationships(edge_partitions, element_ids, chunk_size)
         
-        with self.driver.session() as session:
-            relationship_data = []
-            processed = 0
+        print(f"\nCreated parent-child relationships")
+        print(f"Successfully loaded {total_nodes:,} taxonomy entries into Neo4j")
+    
+    def load_relationships_from_csv(self, partitions: List[Tuple[array, array]], element_ids: Dict[int, str], chunk_size: int) -> bool:
+        """Let Neo4j read the edges from a CSV in its import directory; False if that isn't set up"""
+        import_dir = os.getenv('NEO4J_IMPORT_DIR')
+        if not import_dir:
+            return False
+        
+        csv_path = os.path.join(import_dir, EDGES_CSV)
+        try:
+            try:
+                with open(csv_path, 'w', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['parent_id', 'child_id'])
+                    for partition_parents, partition_children in partitions:
+                        writer.writerows(
+                            (element_ids[parent_taxid], element_ids[child_taxid])
+                            for parent_taxid, child_taxid in zip(partition_parents, partition_children)
+                        )
+            except OSError as e:
+                # Nothing has been sent to the server yet
+                print(f"Could not write {csv_path} ({e}), sending relationships through the driver instead")
+                return False
             
-            for taxid, node_info in nodes.items():
-                parent_taxid = node_info['parent_taxid']
-                
-                # Skip root node (parent_taxid is None or same as taxid)
-                if parent_taxid and parent_taxid != taxid:
-                    relationship_data.append({
-                        'parent_taxid': parent_taxid,
-                        'child_taxid': taxid
-                    })
-                
-                processed += 1
-                
-                if len(relationship_data) >= chunk_size:
-                    # Insert this chunk of relationships
-                    progress = (processed / total_nodes) * 100
-                    print(f"\rCreating relationships: {progress:.1f}% ({processed:,}/{total_nodes:,})", end="", flush=True)
-                    
-                    session.run("""
-                        UNWIND $relationships as rel
-                        MATCH (parent:Taxon {taxid: rel.parent_taxid})
-                        MATCH (child:Taxon {taxid: rel.child_taxid})
+            # IN TRANSACTIONS needs an auto-commit transaction, hence session.run
+            with self.driver.session(database=self.database) as session:
+                session.run(f"""
+                    LOAD CSV WITH HEADERS FROM 'file:///{EDGES_CSV}' as row
+                    CALL (row) {{
+                        MATCH (parent) WHERE elementId(parent) = row.parent_id
+                        MATCH (child) WHERE elementId(child) = row.child_id
                         CREATE (parent)-[:PARENT_OF]->(child)
-                    """, relationships=relationship_data)
+                    }} IN TRANSACTIONS OF {chunk_size} ROWS
+                """).consume()
+        except ClientError as e:
+            # Only a file the server cannot see is known to fail before any batch commits;
+            # any other error may leave edges behind, so falling back would duplicate them
+            if e.code != 'Neo.ClientError.Statement.ExternalResourceFailed':
+                raise
+            print(f"LOAD CSV unavailable ({e}), sending relationships through the driver instead")
+            return False
+        finally:
+            if os.path.exists(csv_path):
+                os.remove(csv_path)
+        
+        return True
+    
+    def create_relationships(self, partitions: List[Tuple[array, array]], element_ids: Dict[int, str], chunk_size: int):
+        """Create staged (parent, child) edges in parallel batches, one writer per partition"""
+        # Deadlocks between writers are retried by execute_write within IMPORT_MAX_RETRY_TIME
+        batch_size = min(chunk_size, PARALLEL_EDGE_BATCH_SIZE)
+        total_relationships = sum(len(partition_parents) for partition_parents, _ in partitions)
+        progress_lock = threading.Lock()
+        created = 0
+        
+        def create_batch(tx, batch):
+            tx.run("""
+                UNWIND $relationships as rel
+                // Element id seeks skip the two taxid index probes per edge
+                MATCH (parent) WHERE elementId(parent) = rel.parent_id
+                MATCH (child) WHERE elementId(child) = rel.child_id
+                CREATE (parent)-[:PARENT_OF]->(child)
+            """, relationships=batch).consume()
+        
+        def load_partition(partition):
+            partition_parents, partition_children = partition
+            nonlocal created
+            with self.driver.session(database=self.database) as session:
+                for start in range(0, len(partition_parents), batch_size):
+                    batch = [
+                        {'parent_id': element_ids[parent_taxid], 'child_id': element_ids[child_taxid]}
+                        for parent_taxid, child_taxid in zip(
+                            partition_parents[start:start + batch_size],
+                            partition_children[start:start + batch_size]
+                        )
+                    ]
+                    session.execute_write(create_batch, batch)
                     
-                    relationship_data = []
-            
-            # Insert remaining relationships
-            if relationship_data:
-                session.run("""
-                    UNWIND $relationships as rel
-                    MATCH (parent:Taxon {taxid: rel.parent_taxid})
-                    MATCH (child:Taxon {taxid: rel.child_taxid})
-                    CREATE (parent)-[:PARENT_OF]->(child)
-                """, relationships=relationship_data)
+                    with progress_lock:
+                        created += len(batch)
+                        progress = (created / total_relationships) * 100
+                        print(f"\rCreating relationships: {progress:.1f}% ({created:,}/{total_relationships:,})", end="", flush=True)
         
-        print(f"\nCreated parent-child relationships")
-        print(f"Successfully loaded {total_nodes:,} taxonomy entries into Neo4j")
+        with ThreadPoolExecutor(max_workers=IMPORT_WRITERS) as executor:
+            # list() re-raises the first failure from any writer
+            list(executor.map(load_partition, partitions))
     
     def verify_migration(self):
         """Verify the migration was successful"""
         print("\n=== Verifying Migration ===")
         
-        with self.driver.session() as session:
+        # Read-only checks with small results: explicit read transactions, all rows in one fetch
+        with self.driver.session(database=self.database, default_access_mode=READ_ACCESS, fetch_size=-1) as session:
             # Count total nodes
-            node_count = session.run("MATCH (n:Taxon) RETURN count(n) as count").single()['count']
+            node_count = session.execute_read(
+                lambda tx: tx.run("MATCH (n:Taxon) RETURN count(n) as count").single()['count']
+            )
             print(f"Total nodes: {node_count:,}")
             
             # Count relationships
-            rel_count = session.run("MATCH ()-[r:PARENT_OF]->() RETURN count(r) as count").single()['count']
+            rel_count = session.execute_read(
+                lambda tx: tx.run("MATCH ()-[r:PARENT_OF]->() RETURN count(r) as count").single()['count']
+            )
             print(f"Total relationships: {rel_count:,}")
             
             # Test specific species
@@ -298,12 +487,17 @@ class NCBIToNeo4jMigrator:
             ]
             
             print("\nTesting specific species:")
+            # One round trip for all of them
+            found = session.execute_read(lambda tx: {
+                record['taxid']: record
+                for record in tx.run("""
+                    UNWIND $taxids as taxid
+                    MATCH (t:Taxon {taxid: taxid})
+                    RETURN taxid, t.scientific_name as name, t.rank as rank
+                """, taxids=[taxid for taxid, _ in test_species])
+            })
             for taxid, expected_name in test_species:
-                result = session.run("""
-                    MATCH (t:Taxon {taxid: $taxid})
-                    RETURN t.scientific_name as name, t.rank as rank
-                """, taxid=taxid).single()
-                
+                result = found.get(taxid)
                 if result:
                     print(f"✓ {expected_name} (taxid: {taxid}) - {result['name']} ({result['rank']})")
                 else:
@@ -311,21 +505,26 @@ class NCBIToNeo4jMigrator:
             
             # Test human-monkey ancestry
             print("\nTesting human-monkey common ancestry:")
-            lca_result = session.run("""
-                // Get ancestors of human (9606)
-                MATCH (s1:Taxon {taxid: 9606})
-                MATCH (s1)<-[:PARENT_OF*0..20]-(a1:Taxon)
-                WITH collect(a1.taxid) as ancestors1
+            lca_result = session.execute_read(lambda tx: tx.run("""
+                // Ancestors of human (9606): each taxon has one parent, so the single path
+                // up to the root holds them all; a depth cap of 20 cut lineages short
+                MATCH path1 = (:Taxon {taxid: 9606})<-[:PARENT_OF]-{0,64}(root1)
+                WHERE NOT ()-[:PARENT_OF]->(root1)
+                WITH [n IN nodes(path1) | n.taxid] as ancestors1
                 
-                // Get ancestors of monkey (9544)  
-                MATCH (s2:Taxon {taxid: 9544})
-                MATCH (s2)<-[:PARENT_OF*0..20]-(a2:Taxon)
-                WITH ancestors1, collect(a2.taxid) as ancestors2
+                // Ancestors of monkey (9544)
+                MATCH path2 = (:Taxon {taxid: 9544})<-[:PARENT_OF]-{0,64}(root2)
+                WHERE NOT ()-[:PARENT_OF]->(root2)
+                WITH ancestors1, [n IN nodes(path2) | n.taxid] as ancestors2
                 
                 RETURN size(ancestors1) as human_ancestor_count,
                        size(ancestors2) as monkey_ancestor_count,
                        size([x IN ancestors1 WHERE x IN ancestors2]) as common_count
-            """).single()
+            """).single())
+            
+            if lca_result is None:
+                print("✗ Human-monkey ancestry test FAILED")
+                return
             
             print(f"Human ancestors: {lca_result['human_ancestor_count']}")
             print(f"Monkey ancestors: {lca_result['monkey_ancestor_count']}")
@@ -374,6 +573,11 @@ class SimpleAutoInitializer:
         self.is_running = False
         self.is_complete = False
         self.error = None
+        self.completion_callbacks = []
+    
+    def add_completion_callback(self, callback):
+        """Register a callable to run once an import finishes successfully"""
+        self.completion_callbacks.append(callback)
         
     def start_import(self):
         """Start database import in background"""
@@ -401,6 +605,9 @@ class SimpleAutoInitializer:
             self.is_running = False
             print("✅ Database import completed successfully!")
             
+            for callback in self.completion_callbacks:
+                callback()
+            
         except Exception as e:
             self.error = str(e)
             self.is_running = False
@@ -0,0 +1,112 @@
+"""
+Shared pytest fixtures
+"""
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from models import SimpleLineageViewer
+
+
+@pytest.fixture(scope="session")
+def viewer():
+    """One SimpleLineageViewer, and so one driver and connection pool, for the whole test run"""
+    viewer = SimpleLineageViewer()
+    # Taxid lookups in the tests rely on the unique constraint's index
+    viewer.ensure_indexes()
+    # Run each query shape once so the server has compiled its plan before any test
+    # is timed; the viewer's own caches are then dropped so tests still hit the database
+    viewer.get_comparative_lineage(9606, 9606)
+    viewer.get_comparative_lineage(9685, 9606)
+    viewer.compare_with_human(9685)
+    viewer.get_species_lineage(9606)
+    viewer.search_species_by_name("human")
+    viewer.get_sample_species()
+    viewer.clear_cache()
+    yield viewer
+    viewer.close()
+
+
+@pytest.fixture(scope="session")
+def api_server():
+    """Base URL of the running API server, probed once per run; skips the API tests if it is down"""
+    base_url = "http://localhost:5001"
+    try:
+        response = requests.get(f"{base_url}/api/sample", timeout=1)
+    except requests.exceptions.RequestException:
+        pytest.skip("Server not running on port 5001")
+    if response.status_code != 200:
+        pytest.skip("Server not responding correctly")
+    return base_url
+
+
+@pytest.fixture(scope="session")
+def get_json(api_server):
+    """Memoized GET returning (status_code, parsed JSON), so repeated endpoint checks hit the server once"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.1)
+    ))
+    
+    # Only used for idempotent GETs against read endpoints
+    @functools.lru_cache(maxsize=64)
+    def get_json(path):
+        response = session.get(f"{api_server}{path}")
+        return response.status_code, response.json()
+    
+    yield get_json
+    session.close()
+
+
+# Comparisons asserted on by several tests are fetched once per run
+COMPARISON_PAIRS = {
+    'cat_human': (9685, 9606),
+    'cow_human': (9913, 9606),
+    'human_human': (9606, 9606),
+}
+
+
+@pytest.fixture(scope="session")
+def comparisons(viewer):
+    """All shared comparisons, fetched concurrently; the driver hands each call its own session"""
+    with ThreadPoolExecutor(max_workers=len(COMPARISON_PAIRS)) as executor:
+        futures = {
+            name: executor.submit(viewer.get_comparative_lineage, *pair)
+            for name, pair in COMPARISON_PAIRS.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+@pytest.fixture(scope="session")
+def cat_human(comparisons):
+    """Cat (9685) compared with human (9606)"""
+    return comparisons['cat_human']
+
+
+@pytest.fixture(scope="session")
+def cat_human_shared(cat_human):
+    """Taxids flagged as shared in the cat and human lineages, extracted in one pass"""
+    return tuple(
+        [item['taxid'] for item in cat_human[species]['lineage'] if item['shared']]
+        for species in ('species1', 'species2')
+    )
+
+
+@pytest.fixture(scope="session")
+def cow_human(comparisons):
+    """Cow (9913) compared with human (9606)"""
+    return comparisons['cow_human']
+
+
+@pytest.fixture(scope="session")
+def human_human(comparisons):
+    """Human (9606) compared with itself"""
+    return comparisons['human_human']
@@ -7,7 +7,8 @@ import pytest
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app import app
+from flask import jsonify
+from app import app, project_fields, is_cacheable, MAX_BATCH_PAIRS
 
 @pytest.fixture
 def client():
@@ -44,3 +45,78 @@ class TestFlaskAPI:
         """Test species comparison endpoint"""
         response = client.get('/api/compare/9606/9685')  # human vs cat
         assert response.status_code in [200, 500]  # 500 if no database connection
+        
+    def test_api_compare_fields(self, client):
+        """Test field projection on the comparison endpoint"""
+        response = client.get('/api/compare/9685?fields=species1.display_name,comparison.common_ancestor')
+        assert response.status_code in [200, 404, 500]  # 500 if no database connection
+        if response.status_code == 200:
+            data = response.get_json()
+            assert set(data) == {'species1', 'comparison'}
+            assert set(data['species1']) == {'display_name'}
+        
+    def test_project_fields(self):
+        """Test dotted-path projection keeps only the requested fields"""
+        data = {
+            'species1': {'display_name': 'cat', 'lineage': [{'taxid': 1}]},
+            'comparison': {'common_ancestor': {'taxid': 314145, 'name': 'Laurasiatheria'}, 'total_common_ancestors': 20}
+        }
+        projected = project_fields(data, 'species1.display_name, comparison.common_ancestor,missing.field')
+        assert projected == {
+            'species1': {'display_name': 'cat'},
+            'comparison': {'common_ancestor': {'taxid': 314145, 'name': 'Laurasiatheria'}}
+        }
+        
+    def test_empty_results_are_not_cacheable(self):
+        """Test that error tuples and empty result lists are kept out of the response cache"""
+        with app.app_context():
+            assert is_cacheable(jsonify({'species': [{'taxid': 9606}]}))
+            assert not is_cacheable(jsonify({'species': []}))
+            assert not is_cacheable((jsonify({'error': 'Species not found'}), 404))
+        
+    def test_api_compare_batch(self, client):
+        """Test batch comparison endpoint"""
+        response = client.post('/api/compare/batch', json={'pairs': [[9685, 9606], [9913, 9606]]})
+        assert response.status_code in [200, 500]  # 500 if no database connection
+        
+    @pytest.mark.parametrize('body', [
+        [[9685, 9606]],                        # not an object
+        'pairs',
+        42,
+        {},                                    # missing pairs
+        {'pairs': []},
+        {'pairs': [9685, 9606]},               # pairs of the wrong shape
+        {'pairs': [[9685]]},
+        {'pairs': [[9685, 9606, 9913]]},
+        {'pairs': [[9685, '9606']]},           # non-integer taxids
+        {'pairs': [[9685, True]]},
+        {'pairs': [[9685.0, 9606]]},
+    ])
+    def test_api_compare_batch_invalid(self, client, body):
+        """Test batch comparison rejects malformed bodies"""
+        response = client.post('/api/compare/batch', json=body)
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+        
+    def test_api_compare_batch_too_many_pairs(self, client):
+        """Test batch comparison rejects more than MAX_BATCH_PAIRS pairs"""
+        response = client.post('/api/compare/batch', json={'pairs': [[9685, 9606]] * (MAX_BATCH_PAIRS + 1)})
+        assert response.status_code == 400
+        assert 'error' in response.get_json()
+        
+    def test_api_cache_clear(self, client, monkeypatch):
+        """Test cache clear endpoint"""
+        monkeypatch.setattr('app.CACHE_ADMIN_TOKEN', 'secret')
+        response = client.post('/api/cache/clear', headers={'X-Admin-Token': 'secret'})
+        assert response.status_code == 200
+        assert response.get_json()['cleared'] is True
+        
+    def test_api_cache_clear_requires_token(self, client, monkeypatch):
+        """Test cache clear endpoint rejects missing or wrong tokens"""
+        monkeypatch.setattr('app.CACHE_ADMIN_TOKEN', 'secret')
+        assert client.post('/api/cache/clear').status_code == 403
+        assert client.post('/api/cache/clear', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+        
+        # With no token configured the route is disabled outright
+        monkeypatch.setattr('app.CACHE_ADMIN_TOKEN', None)
+        assert client.post('/api/cache/clear').status_code == 403
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests for the NCBI dump parsing in the importer, run on a small synthetic taxonomy
+"""
+
+import pytest
+import shutil
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from setup import NCBIToNeo4jMigrator, read_dmp_rows
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+NODES_PATH = os.path.join(DATA_DIR, "nodes.dmp")
+NAMES_PATH = os.path.join(DATA_DIR, "names.dmp")
+
+@pytest.fixture(scope="module")
+def migrator():
+    """Migrator whose parsing helpers are exercised; its driver never connects"""
+    migrator = NCBIToNeo4jMigrator()
+    yield migrator
+    migrator.driver.close()
+    shutil.rmtree(migrator.temp_dir, ignore_errors=True)
+
+@pytest.fixture(scope="module")
+def taxonomy(migrator):
+    """Parent and rank columns parsed from the synthetic nodes.dmp"""
+    return migrator.parse_nodes_file(NODES_PATH)
+
+class TestDumpParsing:
+    """Test parsing of the nodes.dmp and names.dmp files"""
+    
+    def test_read_dmp_rows(self):
+        """Test rows are split into byte fields with the trailing separator stripped"""
+        rows = list(read_dmp_rows(NAMES_PATH))
+        assert rows[0] == [b'1', b'root', b'', b'scientific name']
+        # The Windows line ending is stripped like a plain newline
+        assert [b'9605', b'Homo', b'', b'scientific name'] in rows
+    
+    def test_read_empty_dmp(self, tmp_path):
+        """Test an empty dump yields no rows instead of failing to mmap"""
+        empty_path = tmp_path / "empty.dmp"
+        empty_path.write_bytes(b'')
+        assert list(read_dmp_rows(str(empty_path))) == []
+    
+    def test_parse_nodes(self, taxonomy):
+        """Test parents and ranks, with the root's self-reference and malformed rows dropped"""
+        parents, ranks = taxonomy
+        
+        assert parents == {
+            1: None, 2759: 1, 9604: 2759, 9605: 9604, 9606: 9605,
+            9596: 9604, 9598: 9596, 4751: 2759, 4932: 4751
+        }
+        assert ranks[9606] == 'species'
+        assert ranks[1] == 'no rank'
+        # Rank strings are decoded once and shared
+        assert ranks[9606] is ranks[9598]
+    
+    def test_parse_names(self, migrator, taxonomy):
+        """Test the first scientific and common name of each taxon are kept"""
+        parents, _ = taxonomy
+        scientific_names, common_names = migrator.parse_names_file(NAMES_PATH, list(parents) + [12345])
+        
+        assert scientific_names[9606] == 'Homo sapiens'
+        assert scientific_names[9605] == 'Homo'
+        assert scientific_names[12345] is None
+        assert 'bad' not in scientific_names
+        
+        # Only "common name" rows count, and the first one wins
+        assert common_names == {9604: 'great apes', 9606: 'human', 9598: 'chimpanzé'}
+    
+    def test_parse_empty_names(self, migrator, tmp_path):
+        """Test an empty names.dmp parses to empty columns"""
+        empty_path = tmp_path / "names.dmp"
+        empty_path.write_bytes(b'')
+        assert migrator.parse_names_file(str(empty_path)) == ({}, {})
+
+class TestLineageMaterialization:
+    """Test the depths and lineages stored on each taxon at import"""
+    
+    def test_compute_depths(self, migrator, taxonomy):
+        """Test every taxon's distance from the root"""
+        parents, _ = taxonomy
+        assert migrator.compute_depths(parents) == {
+            1: 0, 2759: 1, 9604: 2, 4751: 2, 9605: 3, 9596: 3, 4932: 3, 9606: 4, 9598: 4
+        }
+    
+    def test_get_lineage_taxids(self, migrator, taxonomy):
+        """Test lineages run from the root down to the taxon"""
+        parents, _ = taxonomy
+        assert migrator.get_lineage_taxids(9606, parents) == [1, 2759, 9604, 9605, 9606]
+        assert migrator.get_lineage_taxids(1, parents) == [1]
+    
+    def test_shared_with_human(self, migrator, taxonomy):
+        """Test the ancestors shared with human are a root-first prefix ending at the MRCA"""
+        parents, _ = taxonomy
+        human_lineage = set(migrator.get_lineage_taxids(9606, parents))
+        
+        chimp = migrator.get_shared_lineage(migrator.get_lineage_taxids(9598, parents), human_lineage)
+        assert chimp == [1, 2759, 9604]
+        
+        yeast = migrator.get_shared_lineage(migrator.get_lineage_taxids(4932, parents), human_lineage)
+        assert yeast == [1, 2759]
+        
+        human = migrator.get_shared_lineage(migrator.get_lineage_taxids(9606, parents), human_lineage)
+        assert human == [1, 2759, 9604, 9605, 9606]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])